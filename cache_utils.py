@@ -0,0 +1,22 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Optional
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Redis configuration (optional shared cache layer)
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+@lru_cache(maxsize=1)
+def get_redis_client() -> Optional[redis.Redis]:
+    """Return a shared Redis client, or None when REDIS_URL is not configured"""
+    if not REDIS_URL:
+        return None
+    logger.info("Using Redis cache layer")
+    return redis.from_url(REDIS_URL)
@@ -1,37 +1,33 @@
+import ahocorasick
+import asyncio
+import hashlib
+import httpx
 import json
 import logging
-from typing import Dict, Any
-from openai import OpenAI
+import pickle
+import time
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Union
+from cachetools import LRUCache
+from openai import AsyncOpenAI, APIError, APIStatusError, RateLimitError
 from models import ExtractedKeywords, ConfidenceEnum, KeywordExtractionResponse
+from cache_utils import get_redis_client
+from rate_limiter import AsyncLimiter
+from openai_utils import build_http_client, get_openai_client, get_embedding, EMBEDDING_DIMENSION
+from semantic_cache import SemanticCache
 import os
 
 logger = logging.getLogger(__name__)
 
-# OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Keep extraction calls within the OpenAI RPM/TPM budget
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", 500))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", 200000))
+OPENAI_RATE_LIMIT_RETRIES = int(os.getenv("OPENAI_RATE_LIMIT_RETRIES", 3))
 
-class ConsultationService:
-    
-    CATEGORY_MAPPING = {
-        "digestive": ["vomiting", "diarrhea", "constipation", "loss of appetite", "stomach", "intestinal", "nausea", "bloating"],
-        "respiratory": ["coughing", "breathing difficulty", "wheezing", "sneezing", "nose", "chest", "lungs", "throat"],
-        "dermatological": ["skin", "fur", "hair loss", "itching", "rash", "allergies", "scratching", "scales"],
-        "musculoskeletal": ["limping", "joint pain", "muscle", "bone", "leg", "hip", "back", "mobility"],
-        "neurological": ["seizures", "tremors", "coordination", "balance", "head", "brain", "nervous"],
-        "urinary": ["urination", "bladder", "kidney", "urine", "frequency", "blood in urine"],
-        "behavioral": ["aggression", "anxiety", "depression", "behavioral changes", "restlessness", "lethargy"],
-        "ophthalmologic": ["eye", "vision", "discharge", "redness", "squinting", "blindness"],
-        "otic": ["ear", "hearing", "discharge", "odor", "scratching ears", "head shaking"],
-        "dental": ["teeth", "gums", "mouth", "bad breath", "chewing difficulty", "oral"],
-        "reproductive": ["pregnancy", "heat", "breeding", "reproductive", "genital"],
-        "emergency": ["trauma", "poisoning", "severe pain", "unconscious", "bleeding", "accident"]
-    }
-
-    @staticmethod
-    async def extract_keywords_and_categorize(complaint: str) -> KeywordExtractionResponse:
-        """Extract keywords and categorize the complaint using OpenAI"""
-        
-        prompt = f"""
+# Extraction model and prompts
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "gpt-4o-mini")
+EXTRACTION_SYSTEM_PROMPT = "You are a veterinary AI assistant specialized in analyzing pet health complaints. Always respond with valid JSON."
+EXTRACTION_PROMPT_TEMPLATE = """
         As a veterinary AI assistant, analyze the following pet owner's complaint and extract relevant information.
 
         Pet Owner's Complaint: "{complaint}"
@@ -66,96 +62,361 @@ class ConsultationService:
         }}
         """
 
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a veterinary AI assistant specialized in analyzing pet health complaints. Always respond with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Try to parse the JSON response
+# Optional secondary OpenAI-compatible provider (e.g. another vendor's compat endpoint or local vLLM)
+FALLBACK_LLM_BASE_URL = os.getenv("FALLBACK_LLM_BASE_URL")
+FALLBACK_LLM_API_KEY = os.getenv("FALLBACK_LLM_API_KEY")
+FALLBACK_LLM_MODEL = os.getenv("FALLBACK_LLM_MODEL")
+FALLBACK_LLM_RPM = int(os.getenv("FALLBACK_LLM_RPM", OPENAI_RPM))
+FALLBACK_LLM_TPM = int(os.getenv("FALLBACK_LLM_TPM", OPENAI_TPM))
+
+# Per-provider time to first byte, idle gap allowed between streamed chunks,
+# cooldown after a failure, and latency smoothing factor
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 8.0))
+EXTRACTION_STREAM_IDLE_TIMEOUT = float(os.getenv("EXTRACTION_STREAM_IDLE_TIMEOUT", 5.0))
+PROVIDER_COOLDOWN = float(os.getenv("PROVIDER_COOLDOWN", 30.0))
+PROVIDER_EWMA_ALPHA = 0.2
+
+class LLMProvider:
+    """An OpenAI-compatible chat endpoint with its own rate limiter and latency estimate"""
+    
+    def __init__(self, name: str, client: AsyncOpenAI, model: str, limiter: AsyncLimiter):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.limiter = limiter
+        self.ewma_latency = 0.0
+        self.unhealthy_until = 0.0
+    
+    def record_success(self, latency: float) -> None:
+        """Fold a successful call's latency into the moving average"""
+        if self.ewma_latency:
+            self.ewma_latency = PROVIDER_EWMA_ALPHA * latency + (1 - PROVIDER_EWMA_ALPHA) * self.ewma_latency
+        else:
+            self.ewma_latency = latency
+    
+    def record_failure(self) -> None:
+        """Deprioritize the provider for the cooldown period"""
+        self.unhealthy_until = time.monotonic() + PROVIDER_COOLDOWN
+    
+    def routing_key(self) -> tuple:
+        """Healthy providers first, then fastest by moving-average latency"""
+        return (self.unhealthy_until > time.monotonic(), self.ewma_latency)
+
+@lru_cache(maxsize=1)
+def get_llm_providers() -> List[LLMProvider]:
+    """Return the extraction providers, created on first use"""
+    providers = [LLMProvider(
+        "openai",
+        get_openai_client(),
+        EXTRACTION_MODEL,
+        AsyncLimiter(requests_per_minute=OPENAI_RPM, tokens_per_minute=OPENAI_TPM)
+    )]
+    if FALLBACK_LLM_BASE_URL and FALLBACK_LLM_MODEL:
+        providers.append(LLMProvider(
+            "fallback",
+            AsyncOpenAI(base_url=FALLBACK_LLM_BASE_URL, api_key=FALLBACK_LLM_API_KEY, http_client=build_http_client()),
+            FALLBACK_LLM_MODEL,
+            AsyncLimiter(requests_per_minute=FALLBACK_LLM_RPM, tokens_per_minute=FALLBACK_LLM_TPM)
+        ))
+    return providers
+
+async def close_llm_providers() -> None:
+    """Close the clients owned by the extraction providers, if they were created"""
+    if not get_llm_providers.cache_info().currsize:
+        return
+    for provider in get_llm_providers():
+        # The primary provider shares get_openai_client(), which its owner closes
+        if provider.client is not get_openai_client():
+            await provider.client.close()
+
+def _strict_json_schema(schema: Any) -> Any:
+    """Adapt a pydantic JSON schema to strict structured outputs: every property required, no extras, no defaults"""
+    if isinstance(schema, list):
+        return [_strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    strict = {key: _strict_json_schema(value) for key, value in schema.items() if key != "default"}
+    if strict.get("type") == "object" and "properties" in strict:
+        strict["required"] = list(strict["properties"])
+        strict["additionalProperties"] = False
+    return strict
+
+# Response schema for strict structured outputs, mirroring KeywordExtractionResponse
+EXTRACTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "keyword_extraction",
+        "strict": True,
+        "schema": _strict_json_schema(KeywordExtractionResponse.model_json_schema())
+    }
+}
+
+# Extraction result cache: in-process LRU, backed by Redis when REDIS_URL is set
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", 4096))
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", 86400))
+_extraction_cache = LRUCache(maxsize=EXTRACTION_CACHE_SIZE)
+
+# Opt-in reuse of an earlier analysis for a reworded complaint whose embedding is at least this similar.
+# Off by default: a small wording change ("eating" / "not eating") can change the analysis
+EXTRACTION_SEMANTIC_THRESHOLD = float(os.getenv("EXTRACTION_SEMANTIC_THRESHOLD", 0))
+_semantic_extraction_cache = (
+    SemanticCache(EMBEDDING_DIMENSION, maxlen=EXTRACTION_CACHE_SIZE, threshold=EXTRACTION_SEMANTIC_THRESHOLD)
+    if EXTRACTION_SEMANTIC_THRESHOLD > 0 else None
+)
+
+class ConsultationService:
+    
+    CATEGORY_MAPPING = {
+        "digestive": ["vomiting", "diarrhea", "constipation", "loss of appetite", "stomach", "intestinal", "nausea", "bloating"],
+        "respiratory": ["coughing", "breathing difficulty", "wheezing", "sneezing", "nose", "chest", "lungs", "throat"],
+        "dermatological": ["skin", "fur", "hair loss", "itching", "rash", "allergies", "scratching", "scales"],
+        "musculoskeletal": ["limping", "joint pain", "muscle", "bone", "leg", "hip", "back", "mobility"],
+        "neurological": ["seizures", "tremors", "coordination", "balance", "head", "brain", "nervous"],
+        "urinary": ["urination", "bladder", "kidney", "urine", "frequency", "blood in urine"],
+        "behavioral": ["aggression", "anxiety", "depression", "behavioral changes", "restlessness", "lethargy"],
+        "ophthalmologic": ["eye", "vision", "discharge", "redness", "squinting", "blindness"],
+        "otic": ["ear", "hearing", "discharge", "odor", "scratching ears", "head shaking"],
+        "dental": ["teeth", "gums", "mouth", "bad breath", "chewing difficulty", "oral"],
+        "reproductive": ["pregnancy", "heat", "breeding", "reproductive", "genital"],
+        "emergency": ["trauma", "poisoning", "severe pain", "unconscious", "bleeding", "accident"]
+    }
+
+    # Keyword lists used by the pattern-matching fallback, keyed by ExtractedKeywords field
+    FALLBACK_KEYWORDS = {
+        "symptoms": ["vomiting", "diarrhea", "coughing", "sneezing", "itching", "limping", "bleeding", "swelling", "discharge"],
+        "body_parts": ["tail", "leg", "eye", "ear", "mouth", "nose", "stomach", "back", "paw", "head"],
+        "duration": ["yesterday", "today", "days", "weeks", "hours", "suddenly", "gradually"],
+        "behavioral_changes": ["not eating", "hiding", "aggressive", "lethargic", "restless"]
+    }
+
+    @staticmethod
+    async def extract_keywords_and_categorize(complaint: str) -> KeywordExtractionResponse:
+        """Extract keywords and categorize the complaint using OpenAI"""
+        
+        cache_key = ConsultationService._cache_key(complaint)
+        cached = await ConsultationService._get_cached_extraction(cache_key)
+        if cached is not None:
+            logger.info("Keyword extraction cache hit")
+            return cached
+
+        complaint_vector = None
+        if _semantic_extraction_cache is not None:
             try:
-                parsed_response = json.loads(content)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, try to extract JSON from the response
-                import re
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    parsed_response = json.loads(json_match.group())
-                else:
-                    raise ValueError("Could not extract valid JSON from OpenAI response")
-            
-            # Validate and create response
-            extracted_keywords = ExtractedKeywords(**parsed_response["extracted_keywords"])
+                complaint_vector = await get_embedding(complaint)
+            except Exception as e:
+                logger.warning(f"Complaint embedding failed, skipping semantic cache: {e}")
+            if complaint_vector is not None:
+                cached = _semantic_extraction_cache.get(complaint_vector)
+                if cached is not None:
+                    logger.info("Keyword extraction semantic cache hit")
+                    return cached
+
+        prompt = EXTRACTION_PROMPT_TEMPLATE.format(complaint=complaint)
+
+        try:
+            content = await ConsultationService._complete_with_failover(prompt)
             
-            return KeywordExtractionResponse(
-                extracted_keywords=extracted_keywords,
-                complaint_category=parsed_response["complaint_category"],
-                confidence_score=ConfidenceEnum(parsed_response["confidence_score"]),
-                reasoning=parsed_response["reasoning"]
-            )
+            # Strict structured outputs constrain the content to the KeywordExtractionResponse schema;
+            # validation still guards against fallback providers that don't enforce it
+            result = KeywordExtractionResponse.model_validate_json(content)
+            await ConsultationService._set_cached_extraction(cache_key, result)
+            if complaint_vector is not None:
+                _semantic_extraction_cache.put(complaint_vector, result)
+            return result
             
         except Exception as e:
-            logger.error(f"Error in keyword extraction: {e}")
+            logger.error(f"Error in keyword extraction ({type(e).__name__}): {e}")
             
             # Fallback: Simple keyword matching
             return ConsultationService._fallback_keyword_extraction(complaint)
     
+    @staticmethod
+    async def _complete_with_failover(prompt: str) -> str:
+        """Try providers fastest-healthy-first, moving on after a timeout, stalled stream, 429 or 5xx"""
+        providers = sorted(get_llm_providers(), key=LLMProvider.routing_key)
+        last_error: Optional[Exception] = None
+        
+        for index, provider in enumerate(providers):
+            # Only the last provider left waits out rate limits; the others fail over straight away
+            is_last = index == len(providers) - 1
+            try:
+                stream, started = await ConsultationService._create_completion(
+                    provider, prompt, rate_limit_retries=OPENAI_RATE_LIMIT_RETRIES if is_last else 0
+                )
+                content = await ConsultationService._read_stream(stream)
+            except (asyncio.TimeoutError, APIError, httpx.HTTPError) as e:
+                # Other 4xx errors are request problems another provider would not fix
+                if isinstance(e, APIStatusError) and e.status_code != 429 and e.status_code < 500:
+                    raise
+                provider.record_failure()
+                last_error = e
+                logger.warning(f"Extraction provider {provider.name} failed ({type(e).__name__}), trying next provider")
+                continue
+            
+            provider.record_success(time.monotonic() - started)
+            return content
+        
+        raise last_error
+    
+    @staticmethod
+    async def _read_stream(stream) -> str:
+        """Collect streamed completion deltas, failing if the stream goes idle"""
+        parts = []
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), timeout=EXTRACTION_STREAM_IDLE_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            await stream.close()
+        return "".join(parts)
+    
+    @staticmethod
+    async def _create_completion(provider: LLMProvider, prompt: str, rate_limit_retries: int):
+        """Start a streamed extraction completion through the provider's rate limiter, honoring Retry-After on 429s
+
+        Returns the stream and the time the successful request was sent.
+        """
+        max_tokens = 1000
+        # Rough estimate of ~4 characters per token for the prompt, plus the completion budget
+        estimated_tokens = (len(EXTRACTION_SYSTEM_PROMPT) + len(prompt)) // 4 + max_tokens
+        
+        for attempt in range(rate_limit_retries + 1):
+            # Queueing in our own limiter and Retry-After sleeps are not provider slowness, so they sit outside the timeout
+            await provider.limiter.acquire(tokens=estimated_tokens)
+            started = time.monotonic()
+            try:
+                # Retries on 429 are handled here so they go back through the limiter.
+                # The timeout covers time to first byte only, so a long but progressing generation is not cut off
+                stream = await asyncio.wait_for(
+                    provider.client.with_options(max_retries=0).chat.completions.create(
+                        model=provider.model,
+                        messages=[
+                            {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.3,
+                        max_tokens=max_tokens,
+                        response_format=EXTRACTION_RESPONSE_FORMAT,
+                        stream=True
+                    ),
+                    timeout=EXTRACTION_TIMEOUT
+                )
+                return stream, started
+            except RateLimitError as e:
+                provider.limiter.refund(tokens=estimated_tokens)
+                if attempt == rate_limit_retries:
+                    raise
+                try:
+                    retry_after = float(e.response.headers.get("retry-after", 1))
+                except ValueError:
+                    retry_after = 1.0
+                logger.warning(f"{provider.name} rate limit hit, retrying in {retry_after}s")
+                await asyncio.sleep(retry_after)
+
+    @staticmethod
+    async def extract_keywords_batch(
+        complaints: List[str],
+        max_concurrent: int = 16
+    ) -> List[Union[KeywordExtractionResponse, BaseException]]:
+        """Extract keywords for many complaints concurrently, preserving input order"""
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def _extract_one(complaint: str) -> KeywordExtractionResponse:
+            async with semaphore:
+                return await ConsultationService.extract_keywords_and_categorize(complaint)
+
+        return await asyncio.gather(
+            *(_extract_one(complaint) for complaint in complaints),
+            return_exceptions=True
+        )
+
+    @staticmethod
+    def _cache_key(complaint: str) -> str:
+        """Build the cache key for a complaint from its normalized text and the extraction config"""
+        normalized = " ".join(complaint.lower().split())
+        return hashlib.sha256(f"{_EXTRACTION_CACHE_NAMESPACE}\0{normalized}".encode()).hexdigest()
+
+    @staticmethod
+    async def _get_cached_extraction(cache_key: str) -> Optional[KeywordExtractionResponse]:
+        """Look up a cached extraction result, checking the local LRU before Redis"""
+        cached = _extraction_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        redis_client = get_redis_client()
+        if redis_client is None:
+            return None
+
+        try:
+            raw = await redis_client.get(f"extraction:{cache_key}")
+        except Exception as e:
+            logger.warning(f"Redis lookup failed for extraction cache: {e}")
+            return None
+
+        if raw is None:
+            return None
+
+        try:
+            cached = KeywordExtractionResponse.model_validate_json(raw)
+        except ValueError as e:
+            logger.warning(f"Ignoring invalid extraction cache entry: {e}")
+            return None
+        _extraction_cache[cache_key] = cached
+        return cached
+
+    @staticmethod
+    async def _set_cached_extraction(cache_key: str, result: KeywordExtractionResponse) -> None:
+        """Store an extraction result in the local LRU and, when configured, in Redis"""
+        _extraction_cache[cache_key] = result
+
+        redis_client = get_redis_client()
+        if redis_client is None:
+            return
+
+        try:
+            await redis_client.setex(f"extraction:{cache_key}", EXTRACTION_CACHE_TTL, result.model_dump_json())
+        except Exception as e:
+            logger.warning(f"Redis write failed for extraction cache: {e}")
+
     @staticmethod
     def _fallback_keyword_extraction(complaint: str) -> KeywordExtractionResponse:
         """Fallback method for keyword extraction using simple pattern matching"""
         complaint_lower = complaint.lower()
         
-        # Simple keyword extraction
-        symptoms = []
-        body_parts = []
-        duration = []
-        severity = []
-        behavioral_changes = []
-        environmental_factors = []
-        
-        # Common symptoms
-        symptom_keywords = ["vomiting", "diarrhea", "coughing", "sneezing", "itching", "limping", "bleeding", "swelling", "discharge"]
-        for keyword in symptom_keywords:
-            if keyword in complaint_lower:
-                symptoms.append(keyword)
-        
-        # Common body parts
-        body_part_keywords = ["tail", "leg", "eye", "ear", "mouth", "nose", "stomach", "back", "paw", "head"]
-        for keyword in body_part_keywords:
-            if keyword in complaint_lower:
-                body_parts.append(keyword)
+        # Fallback keyword buckets, filled in complaint order without duplicates
+        buckets = {bucket: {} for bucket in ConsultationService.FALLBACK_KEYWORDS}
         
-        # Duration indicators
-        duration_keywords = ["yesterday", "today", "days", "weeks", "hours", "suddenly", "gradually"]
-        for keyword in duration_keywords:
-            if keyword in complaint_lower:
-                duration.append(keyword)
+        # Distinct category keywords matched, per category
+        category_hits = {}
         
-        # Behavioral changes
-        behavior_keywords = ["not eating", "hiding", "aggressive", "lethargic", "restless"]
-        for keyword in behavior_keywords:
-            if keyword in complaint_lower:
-                behavioral_changes.append(keyword)
+        # Single Aho-Corasick pass over the complaint covers every keyword list
+        for _, (keyword, hits) in _FALLBACK_AUTOMATON.iter(complaint_lower):
+            for bucket, cat in hits:
+                if bucket is not None:
+                    buckets[bucket][keyword] = None
+                else:
+                    category_hits.setdefault(cat, set()).add(keyword)
         
-        # Determine category based on keywords
+        # Determine category based on keywords: most distinct hits wins, ties keep CATEGORY_MAPPING order
         category = "general"
         confidence = ConfidenceEnum.LOW
         
-        for cat, keywords in ConsultationService.CATEGORY_MAPPING.items():
-            for keyword in keywords:
-                if keyword in complaint_lower:
-                    category = cat
-                    confidence = ConfidenceEnum.MEDIUM
-                    break
-            if category != "general":
-                break
+        if category_hits:
+            category = max(ConsultationService.CATEGORY_MAPPING, key=lambda cat: len(category_hits.get(cat, ())))
+            confidence = ConfidenceEnum.MEDIUM
+        
+        symptoms = list(buckets["symptoms"])
+        body_parts = list(buckets["body_parts"])
+        duration = list(buckets["duration"])
+        severity = []
+        behavioral_changes = list(buckets["behavioral_changes"])
+        environmental_factors = []
         
         return KeywordExtractionResponse(
             extracted_keywords=ExtractedKeywords(
@@ -191,4 +452,68 @@ class ConsultationService:
             "emergency": 10,
             "general": 12
         }
-        return question_counts.get(category, 10)
\ No newline at end of file
+        return question_counts.get(category, 10)
+
+
+# Changing the model, prompts or category mapping invalidates previously cached results
+_EXTRACTION_CACHE_NAMESPACE = hashlib.sha256(
+    "\0".join([
+        EXTRACTION_MODEL,
+        EXTRACTION_SYSTEM_PROMPT,
+        EXTRACTION_PROMPT_TEMPLATE,
+        json.dumps(EXTRACTION_RESPONSE_FORMAT, sort_keys=True),
+        json.dumps(ConsultationService.CATEGORY_MAPPING, sort_keys=True),
+    ]).encode()
+).hexdigest()
+
+
+# On-disk cache of the compiled fallback automaton, invalidated by a hash of its source keyword lists
+FALLBACK_AUTOMATON_CACHE_PATH = os.getenv(
+    "FALLBACK_AUTOMATON_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "vetty", "fallback_automaton.pkl")
+)
+
+
+def _build_fallback_automaton() -> ahocorasick.Automaton:
+    """Compile the fallback keyword lists and category mapping into one Aho-Corasick automaton"""
+    source_hash = hashlib.sha256(
+        json.dumps([ConsultationService.FALLBACK_KEYWORDS, ConsultationService.CATEGORY_MAPPING], sort_keys=True).encode()
+    ).hexdigest()
+    hash_path = f"{FALLBACK_AUTOMATON_CACHE_PATH}.sha256"
+
+    # Reuse the cached automaton when it was built from the same keyword lists
+    try:
+        with open(hash_path) as f:
+            if f.read().strip() == source_hash:
+                return ahocorasick.load(FALLBACK_AUTOMATON_CACHE_PATH, pickle.loads)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Failed to load cached fallback automaton, rebuilding: {e}")
+
+    # A keyword can sit in several lists (e.g. "discharge"), so each carries all of its (bucket, category) hits
+    hits: Dict[str, list] = {}
+    for bucket, keywords in ConsultationService.FALLBACK_KEYWORDS.items():
+        for keyword in keywords:
+            hits.setdefault(keyword, []).append((bucket, None))
+    for category, keywords in ConsultationService.CATEGORY_MAPPING.items():
+        for keyword in keywords:
+            hits.setdefault(keyword, []).append((None, category))
+
+    automaton = ahocorasick.Automaton()
+    for keyword, keyword_hits in hits.items():
+        automaton.add_word(keyword, (keyword, tuple(keyword_hits)))
+    automaton.make_automaton()
+
+    try:
+        os.makedirs(os.path.dirname(FALLBACK_AUTOMATON_CACHE_PATH), exist_ok=True)
+        automaton.save(FALLBACK_AUTOMATON_CACHE_PATH, pickle.dumps)
+        with open(hash_path, "w") as f:
+            f.write(source_hash)
+    except Exception as e:
+        logger.warning(f"Failed to cache fallback automaton to disk: {e}")
+
+    return automaton
+
+
+_FALLBACK_AUTOMATON = _build_fallback_automaton()
@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, JSON, ForeignKey
+from sqlalchemy import create_engine, make_url, Column, Integer, String, DateTime, Text, Boolean, JSON, ForeignKey, Index
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import NullPool
 from sqlalchemy.sql import func
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 import os
 from dotenv import load_dotenv
 
@@ -11,10 +14,54 @@ load_dotenv()
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 40))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Seconds to wait for a free connection before failing, instead of stalling indefinitely
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+# Behind PgBouncer, let it multiplex connections instead of pooling them here as well
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+def _pool_options() -> dict:
+    """Connection pool arguments shared by the sync and async engines"""
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,  # Transparently replace connections dropped by a DB restart
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": True  # Reuse the most recently returned connection so idle ones can time out
+    }
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Return the shared engine, creating its connection pool on first use"""
+    return create_engine(DATABASE_URL, **_pool_options())
+
+@lru_cache(maxsize=1)
+def get_async_engine():
+    """Return the shared asyncio engine used by request handlers, on the asyncpg driver"""
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    if DB_PGBOUNCER and url.get_backend_name() == "postgresql":
+        # Prepared statements don't survive PgBouncer's transaction pooling
+        connect_args = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return create_async_engine(url, connect_args=connect_args, **_pool_options())
+
+# Sessions are bound to get_engine() / get_async_engine() when opened
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# Objects stay usable after commit, since expired attributes can't lazy-load in async code
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
 
+def _utcnow() -> datetime:
+    """Insert-time timestamp set in Python, so new rows don't have to be re-read for it"""
+    return datetime.now(timezone.utc)
+
 class Pet(Base):
     __tablename__ = "pets"
     
@@ -29,7 +76,7 @@ class Pet(Base):
     owner_name = Column(String(100), nullable=True)
     owner_email = Column(String(255), nullable=True)
     owner_phone = Column(String(20), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationship with consultations
@@ -65,12 +112,18 @@ class Consultation(Base):
     retriever_results = Column(JSON, nullable=True)  # Results from both retrievers
     
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationship with pet
     pet = relationship("Pet", back_populates="consultations")
+    
+    __table_args__ = (
+        Index("idx_consultations_pet_status", "pet_id", "status"),
+        # Matches get_pet_consultations' filter and sort, so the rows come back from an index range scan
+        Index("idx_consultations_pet_created", pet_id, created_at.desc()),
+    )
 
 class QuestionTemplate(Base):
     __tablename__ = "question_templates"
@@ -85,15 +138,17 @@ class QuestionTemplate(Base):
     keywords = Column(JSON, nullable=True)  # Keywords that trigger this question
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("idx_question_templates_category_text", "category", "question_text"),
+        Index("idx_question_templates_order", "category", "order_index"),
+    )
 
 # Create tables
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal(bind=get_async_engine()) as db:
+        yield db
\ No newline at end of file
@@ -13,13 +13,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 load_dotenv()
 
-from database_models import create_tables, SessionLocal, QuestionTemplate
+from database_models import create_tables, get_engine, SessionLocal, QuestionTemplate
 from sqlalchemy.exc import IntegrityError
 
 def create_sample_question_templates():
     """Create sample question templates for different categories"""
     
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     
     sample_questions = [
         # Digestive category
@@ -163,19 +163,21 @@ def create_sample_question_templates():
     ]
     
     try:
-        for question_data in sample_questions:
-            # Check if question already exists
-            existing = db.query(QuestionTemplate).filter(
-                QuestionTemplate.category == question_data["category"],
-                QuestionTemplate.question_text == question_data["question_text"]
-            ).first()
-            
-            if not existing:
-                question = QuestionTemplate(**question_data)
-                db.add(question)
+        # Load existing (category, question_text) pairs once and filter in memory
+        existing = {
+            (category, question_text)
+            for category, question_text in db.query(QuestionTemplate.category, QuestionTemplate.question_text).all()
+        }
+        new_questions = [
+            question_data for question_data in sample_questions
+            if (question_data["category"], question_data["question_text"]) not in existing
+        ]
         
+        # Insert all missing templates in one transaction
+        if new_questions:
+            db.bulk_insert_mappings(QuestionTemplate, new_questions)
         db.commit()
-        print(f"✅ Created {len(sample_questions)} sample question templates")
+        print(f"✅ Created {len(new_questions)} sample question templates ({len(sample_questions) - len(new_questions)} already existed)")
         
     except Exception as e:
         print(f"❌ Error creating question templates: {e}")
@@ -15,6 +15,7 @@ CREATE TABLE question_templates (
 -- Create indexes for better performance
 CREATE INDEX idx_question_templates_category ON question_templates(category);
 CREATE INDEX idx_question_templates_order ON question_templates(category, order_index);
+CREATE INDEX idx_question_templates_category_text ON question_templates(category, question_text);
 CREATE INDEX idx_question_templates_type ON question_templates(question_type);
 
 -- Add comments for documentation
@@ -1,21 +1,29 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import sys
 import logging
+import time
 import uvicorn
+from sqlalchemy import text
 from dotenv import load_dotenv
-from openai import OpenAI
 from opensearch_utils import (
     create_opensearch_client, 
+    async_opensearch_client,
     create_all_indexes,
+    warm_knn_indexes,
     T_MEMO_CARTE_INDEX,
     JAPANESE_MEDICAL_DOCUMENTS_INDEX,
     get_index_info,
 )
-from openai_utils import get_embedding
+from openai_utils import get_openai_client, OPENAI_EMBEDDING_MODEL, EMBEDDING_DIMENSION
 
 # Import database models and create tables
-from database_models import create_tables, get_db
+from database_models import create_tables, get_db, get_engine, get_async_engine, AsyncSessionLocal
+from cache_utils import get_redis_client
+from consultation_service import close_llm_providers
 
 from routers import opensearch, consultation
 
@@ -25,10 +33,83 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Initialize OpenSearch client using your configuration
+opensearch_client = create_opensearch_client()
+
+# Cached OpenAI health status as (monotonic timestamp, status)
+OPENAI_HEALTH_TTL = int(os.getenv("OPENAI_HEALTH_TTL", 30))
+_last_openai_check: tuple = (0.0, "")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the application, then release pooled connections on shutdown"""
+    logger.info("Initializing Vetty AI Pet Health Consultation API...")
+    
+    # Create database tables, verify OpenAI API key and create all indexes concurrently,
+    # they are independent I/O and the blocking DDL runs in worker threads
+    # The OpenAI probe goes to the API itself: an embedding could be answered from the Redis cache
+    tables_result, openai_result, indexes_result = await asyncio.gather(
+        asyncio.to_thread(create_tables),
+        get_openai_client().models.list(),
+        asyncio.to_thread(create_all_indexes, opensearch_client),
+        return_exceptions=True
+    )
+    
+    if isinstance(tables_result, Exception):
+        logger.error(f"Failed to create database tables: {tables_result}")
+        raise RuntimeError("Failed to initialize database")
+    logger.info("Database tables created/verified successfully")
+    
+    # Question templates only change when db_init.py seeds them, so serve them from memory
+    try:
+        async with AsyncSessionLocal(bind=get_async_engine()) as db:
+            app.state.templates_by_category = await consultation.load_question_templates(db)
+        logger.info(f"Loaded question templates for {len(app.state.templates_by_category)} categories")
+    except Exception as e:
+        logger.warning(f"Failed to preload question templates, they will be queried per request: {e}")
+    
+    if isinstance(openai_result, Exception):
+        logger.error(f"Failed to connect to OpenAI API: {openai_result}")
+        raise openai_result
+    logger.info(f"OpenAI API connection verified using model: {OPENAI_EMBEDDING_MODEL}")
+    
+    # The startup probe counts as the first health check
+    global _last_openai_check
+    _last_openai_check = (time.monotonic(), "connected")
+    
+    if isinstance(indexes_result, Exception):
+        logger.error(f"Failed to create OpenSearch indexes: {indexes_result}")
+        raise RuntimeError("Failed to create OpenSearch indexes")
+    logger.info(f"OpenSearch indexes created/verified: {indexes_result}")
+    
+    # Load HNSW graphs so the first real kNN query doesn't pay for it
+    warmed_indexes = await warm_knn_indexes(async_opensearch_client)
+    logger.info(f"OpenSearch kNN indexes warmed: {warmed_indexes}")
+    
+    logger.info("Vetty AI Pet Health Consultation API initialized successfully")
+    
+    yield
+    
+    # Close pooled connections, skipping lazily created clients that were never used
+    logger.info("Shutting down Vetty AI Pet Health Consultation API...")
+    await close_llm_providers()
+    if get_openai_client.cache_info().currsize:
+        await get_openai_client().close()
+    await async_opensearch_client.close()
+    opensearch_client.close()
+    redis_client = get_redis_client()
+    if redis_client is not None:
+        await redis_client.aclose()
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+
 app = FastAPI(
     title="Vetty AI - Pet Health Consultation API",
     description="AI-powered pet health consultation system with vector search capabilities using OpenAI Embeddings",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -44,45 +125,6 @@ app.add_middleware(
 app.include_router(opensearch.router, tags=["opensearch"])
 app.include_router(consultation.router, tags=["consultation"])
 
-# OpenAI configuration
-OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
-
-# Initialize OpenSearch client using your configuration
-opensearch_client = create_opensearch_client()
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the application"""
-    logger.info("Initializing Vetty AI Pet Health Consultation API...")
-    
-    # Create database tables
-    try:
-        create_tables()
-        logger.info("Database tables created/verified successfully")
-    except Exception as e:
-        logger.error(f"Failed to create database tables: {e}")
-        raise RuntimeError("Failed to initialize database")
-    
-    # Verify OpenAI API key
-    try:
-        # Test OpenAI connection with a simple embedding request
-        await get_embedding("test")
-        logger.info(f"OpenAI API connection verified using model: {OPENAI_EMBEDDING_MODEL}")
-    except Exception as e:
-        logger.error(f"Failed to connect to OpenAI API: {e}")
-        raise
-    
-    # Create all indexes
-    try:
-        created_indexes = create_all_indexes(opensearch_client)
-        logger.info(f"OpenSearch indexes created/verified: {created_indexes}")
-    except Exception as e:
-        logger.error(f"Failed to create OpenSearch indexes: {e}")
-        raise RuntimeError("Failed to create OpenSearch indexes")
-    
-    logger.info("Vetty AI Pet Health Consultation API initialized successfully")
-
 @app.get("/")
 async def root():
     return {
@@ -105,21 +147,25 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Check OpenSearch connection
-        opensearch_info = opensearch_client.info()
+        opensearch_info = await async_opensearch_client.info()
         
-        # Check OpenAI connection
-        try:
-            await get_embedding("health check")
-            openai_status = "connected"
-        except Exception as e:
-            openai_status = f"error: {str(e)}"
+        # Check OpenAI connection, reusing the last result within the TTL
+        global _last_openai_check
+        checked_at, openai_status = _last_openai_check
+        if time.monotonic() - checked_at >= OPENAI_HEALTH_TTL:
+            try:
+                # Listing models is a cheaper liveness check than an embedding, and
+                # unlike an embedding it is never answered from the embedding cache
+                await get_openai_client().models.list()
+                openai_status = "connected"
+            except Exception as e:
+                openai_status = f"error: {str(e)}"
+            _last_openai_check = (time.monotonic(), openai_status)
         
         # Check database connection
         try:
-            from database_models import SessionLocal
-            db = SessionLocal()
-            db.execute("SELECT 1")
-            db.close()
+            async with get_async_engine().connect() as conn:
+                await conn.execute(text("SELECT 1"))
             database_status = "connected"
         except Exception as e:
             database_status = f"error: {str(e)}"
@@ -135,4 +181,13 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop and httptools are C implementations of the event loop and HTTP parser;
+    # uvloop doesn't support Windows. Workers need the app as an import string.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.getenv("WORKERS", 1))
+    )
\ No newline at end of file
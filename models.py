@@ -1,9 +1,35 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
 
+__all__ = [
+    "MemoCarteModel",
+    "SearchRequest",
+    "SearchResponse",
+    "IndexRequest",
+    "SexEnum",
+    "SpeciesEnum",
+    "ConsultationStatusEnum",
+    "ConfidenceEnum",
+    "QuestionTypeEnum",
+    "PetCreate",
+    "PetResponse",
+    "ExtractedKeywords",
+    "ConsultationStartRequest",
+    "ConsultationStartResponse",
+    "QuestionResponse",
+    "ConsultationUpdateRequest",
+    "QuestionTemplateResponse",
+    "ConsultationResponse",
+    "ConsultationSummaryResponse",
+    "KeywordExtractionResponse",
+]
+
 class MemoCarteModel(BaseModel):
+    # Ingest rows arrive in bulk: drop unknown columns and skip per-field extras like stripping
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=False, validate_assignment=False)
+    
     id_memo_carte: int
     number_memo_carte: Optional[str] = None
     type_input: Optional[int] = None
@@ -38,8 +64,10 @@ class MemoCarteModel(BaseModel):
 
 class SearchRequest(BaseModel):
     query: str = Field(..., description="Search query in Japanese")
-    size: Optional[int] = Field(default=10, description="Number of results to return")
+    size: int = Field(default=10, ge=1, description="Number of results to return")
     search_type: Optional[str] = Field(default="hybrid", description="Search type: vector, keyword, or hybrid")
+    ef_search: int = Field(default=100, ge=1, description="HNSW candidate list size for vector search; higher trades latency for recall")
+    fields: Optional[List[str]] = Field(default=None, description="Extra memo fields to include in each result's source")
 
 class SearchResponse(BaseModel):
     results: List[Dict[str, Any]]
@@ -179,6 +207,19 @@ class ConsultationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ConsultationSummaryResponse(BaseModel):
+    id: int
+    pet_id: int
+    initial_complaint: str
+    complaint_category: Optional[str]
+    confidence_score: Optional[str]
+    status: ConsultationStatusEnum
+    current_question_index: int
+    total_questions: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+    completed_at: Optional[datetime]
+
 class KeywordExtractionResponse(BaseModel):
     extracted_keywords: ExtractedKeywords
     complaint_category: str
@@ -1,6 +1,15 @@
 from fastapi  import HTTPException
+import asyncio
+import base64
+import hashlib
+import httpx
 import logging
-from openai import OpenAI
+import numpy as np
+from cachetools import TTLCache
+from cache_utils import get_redis_client
+from rate_limiter import AsyncLimiter
+from functools import lru_cache
+from openai import AsyncOpenAI
 from typing import List, Optional, Dict, Any
 import os
 
@@ -13,26 +22,174 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
 
-if not OPENAI_API_KEY:
-    logger.error("OPENAI_API_KEY environment variable is required")
-    raise ValueError("OPENAI_API_KEY environment variable is required")
-  
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# Connection pool size for each OpenAI-compatible client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
 
+# Bound concurrent embedding requests to stay under the OpenAI RPM limit
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 20))
+_embedding_semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
 
-async def get_embedding(text: str) -> List[float]:
-    """Generate embedding using OpenAI API"""
+# Embedding requests and tokens per minute, debited before each call so bursts queue instead of hitting 429s
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", 3000))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", 1000000))
+_embedding_limiter = AsyncLimiter(requests_per_minute=EMBEDDING_RPM, tokens_per_minute=EMBEDDING_TPM)
+
+# Estimated token budget per embeddings request, below OpenAI's 300k-token request cap
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 200000))
+
+# In-process embedding cache keyed by (model, text digest)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2000))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 3600))
+_embedding_cache = TTLCache(maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+_embedding_cache_stats = {"hits": 0, "misses": 0, "redis_hits": 0}
+
+# Shared Redis embedding cache (when REDIS_URL is set), checked on in-process misses
+EMBEDDING_REDIS_TTL = int(os.getenv("EMBEDDING_REDIS_TTL", 604800))
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """Create a keep-alive connection pool sized for concurrent OpenAI requests"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    """Return the shared OpenAI client, created on first use"""
+    if not OPENAI_API_KEY:
+        logger.error("OPENAI_API_KEY environment variable is required")
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=build_http_client())
+
+
+def _embedding_cache_key(text: str) -> bytes:
+    """Cache key for a text under the current embedding model"""
+    return OPENAI_EMBEDDING_MODEL.encode() + b":" + hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _redis_embedding_key(cache_key: bytes) -> bytes:
+    """Redis key for an embedding, namespaced by dimension as well as model"""
+    return b"embedding:%d:" % EMBEDDING_DIMENSION + cache_key
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: ~3 UTF-8 bytes per token holds for Japanese and overestimates English"""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters for the in-process embedding cache"""
+    lookups = _embedding_cache_stats["hits"] + _embedding_cache_stats["misses"]
+    return {
+        **_embedding_cache_stats,
+        "hit_rate": _embedding_cache_stats["hits"] / lookups if lookups else 0.0,
+        "size": len(_embedding_cache),
+        "maxsize": _embedding_cache.maxsize,
+        "ttl": _embedding_cache.ttl
+    }
+
+
+async def get_embeddings(texts: List[str], batch_size: int = 512) -> List[List[float]]:
+    """Generate embeddings for many texts, serving repeats from cache and batching the rest"""
+    keys = [_embedding_cache_key(text) for text in texts]
+    embeddings: List[Optional[List[float]]] = [_embedding_cache.get(key) for key in keys]
+    
+    # Embed each distinct uncached text once
+    missing: Dict[bytes, List[int]] = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(keys[i], []).append(i)
+    _embedding_cache_stats["hits"] += len(texts) - sum(len(indices) for indices in missing.values())
+    _embedding_cache_stats["misses"] += len(missing)
+    
+    redis_client = get_redis_client()
+    if missing and redis_client is not None:
+        missing_keys = list(missing)
+        try:
+            cached = await redis_client.mget([_redis_embedding_key(key) for key in missing_keys])
+        except Exception as e:
+            logger.warning(f"Redis lookup failed for embedding cache: {e}")
+            cached = [None] * len(missing_keys)
+        for key, raw in zip(missing_keys, cached):
+            if raw is not None:
+                embedding = np.frombuffer(raw, dtype=np.float32).tolist()
+                _embedding_cache[key] = embedding
+                for i in missing.pop(key):
+                    embeddings[i] = embedding
+                _embedding_cache_stats["redis_hits"] += 1
+    
+    if missing:
+        missing_keys = list(missing)
+        fresh = await _request_embeddings([texts[missing[key][0]] for key in missing_keys], batch_size)
+        for key, embedding in zip(missing_keys, fresh):
+            _embedding_cache[key] = embedding
+            for i in missing[key]:
+                embeddings[i] = embedding
+        
+        if redis_client is not None:
+            try:
+                # Raw float32 bytes, written in one round trip
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    for key, embedding in zip(missing_keys, fresh):
+                        pipe.setex(
+                            _redis_embedding_key(key),
+                            EMBEDDING_REDIS_TTL,
+                            np.asarray(embedding, dtype=np.float32).tobytes()
+                        )
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Redis write failed for embedding cache: {e}")
+    
+    return embeddings
+
+
+async def _request_embeddings(texts: List[str], batch_size: int) -> List[List[float]]:
+    """Generate embeddings using as few OpenAI API requests as possible"""
+    # Sort by length so each request carries similarly sized inputs; results are returned in input order
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    
+    async def _embed_batch(batch: List[int], tokens: int):
+        await _embedding_limiter.acquire(tokens)
+        async with _embedding_semaphore:
+            response = await get_openai_client().embeddings.create(
+                model=OPENAI_EMBEDDING_MODEL,
+                input=[texts[i] for i in batch],
+                # Packed float32 bytes are ~4x smaller on the wire than JSON floats and decode in one copy
+                encoding_format="base64"
+            )
+        return batch, response
+    
     try:
-        response = openai_client.embeddings.create(
-            model=OPENAI_EMBEDDING_MODEL,
-            input=text,
-            encoding_format="float"
-        )
-        return response.data[0].embedding
+        # Cap each request by input count and estimated tokens, then dispatch all batches concurrently
+        batches: List[List[int]] = []
+        batch_tokens: List[int] = []
+        for i in order:
+            tokens = _estimate_tokens(texts[i])
+            if not batches or len(batches[-1]) >= batch_size or batch_tokens[-1] + tokens > EMBEDDING_BATCH_MAX_TOKENS:
+                batches.append([])
+                batch_tokens.append(0)
+            batches[-1].append(i)
+            batch_tokens[-1] += tokens
+        results = await asyncio.gather(*(_embed_batch(batch, tokens) for batch, tokens in zip(batches, batch_tokens)))
+        for batch, response in results:
+            for item in response.data:
+                embeddings[batch[item.index]] = np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32).tolist()
     except Exception as e:
-        logger.error(f"Error generating embedding: {e}")
+        logger.error(f"Error generating embeddings: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate embedding: {str(e)}")
+    
+    return embeddings
+
+
+async def get_embedding(text: str) -> List[float]:
+    """Generate embedding using OpenAI API"""
+    return (await get_embeddings([text]))[0]
       
       
       
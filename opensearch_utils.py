@@ -1,5 +1,13 @@
+import asyncio
 import os
-from opensearchpy import OpenSearch
+import sys
+import orjson
+from cachetools import TTLCache
+from typing import Any, List
+from opensearchpy import AsyncOpenSearch, OpenSearch
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.helpers import async_bulk
+from opensearchpy.serializer import JSONSerializer
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +23,31 @@ OPENSEARCH_ENDPOINT = os.environ.get("OPENSEARCH_ENDPOINT")
 OPENSEARCH_USERNAME = os.environ.get("OPENSEARCH_USERNAME")
 OPENSEARCH_PASSWORD = os.environ.get("OPENSEARCH_PASSWORD")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
+# Connections kept open per node, so bursts reuse warm TLS sessions
+OPENSEARCH_POOL_MAXSIZE = int(os.getenv("OPENSEARCH_POOL_MAXSIZE", 32))
+
+# Index metadata cache: existence and info lookups are slow admin APIs that rarely change
+INDEX_INFO_CACHE_TTL = int(os.getenv("INDEX_INFO_CACHE_TTL", 30))
+_index_exists_cache = TTLCache(maxsize=16, ttl=INDEX_INFO_CACHE_TTL)
+_index_info_cache = TTLCache(maxsize=16, ttl=INDEX_INFO_CACHE_TTL)
+
+class ORJSONSerializer(JSONSerializer):
+    """JSONSerializer that encodes and decodes with orjson"""
+
+    def dumps(self, data: Any) -> Any:
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
+    def loads(self, s: str) -> Any:
+        try:
+            return orjson.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
 
 def create_opensearch_client():
     """Create OpenSearch client for local or AWS instance"""
@@ -26,6 +59,7 @@ def create_opensearch_client():
         # Local OpenSearch configuration with SSL disabled verification
         client = OpenSearch(
             hosts=[OPENSEARCH_ENDPOINT],
+            serializer=ORJSONSerializer(),
             http_auth=(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD) if OPENSEARCH_USERNAME else None,
             use_ssl=OPENSEARCH_ENDPOINT.startswith('https'),
             verify_certs=False,  # Disable certificate verification for local Docker
@@ -33,12 +67,53 @@ def create_opensearch_client():
             ssl_show_warn=False,  # Don't show SSL warnings
             timeout=30,
             max_retries=3,
-            retry_on_timeout=True
+            retry_on_timeout=True,
+            http_compress=True,
+            pool_maxsize=OPENSEARCH_POOL_MAXSIZE
         )
     else:
         # AWS OpenSearch configuration
         client = OpenSearch(
             hosts=[OPENSEARCH_ENDPOINT],
+            serializer=ORJSONSerializer(),
+            http_auth=(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD),
+            use_ssl=True,
+            verify_certs=True,
+            ssl_show_warn=False,
+            timeout=120,
+            max_retries=5,
+            retry_on_timeout=True,
+            http_compress=True,
+            pool_maxsize=OPENSEARCH_POOL_MAXSIZE,
+            headers={"Content-Type": "application/json"}
+        )
+    
+    return client
+
+def create_async_opensearch_client():
+    """Create an asyncio OpenSearch client with the same connection settings as the sync one"""
+    
+    is_local = "localhost" in OPENSEARCH_ENDPOINT or "127.0.0.1" in OPENSEARCH_ENDPOINT
+    
+    if is_local:
+        client = AsyncOpenSearch(
+            hosts=[OPENSEARCH_ENDPOINT],
+            serializer=ORJSONSerializer(),
+            http_auth=(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD) if OPENSEARCH_USERNAME else None,
+            use_ssl=OPENSEARCH_ENDPOINT.startswith('https'),
+            verify_certs=False,
+            ssl_assert_hostname=False,
+            ssl_show_warn=False,
+            timeout=30,
+            max_retries=3,
+            retry_on_timeout=True,
+            http_compress=True,
+            pool_maxsize=OPENSEARCH_POOL_MAXSIZE
+        )
+    else:
+        client = AsyncOpenSearch(
+            hosts=[OPENSEARCH_ENDPOINT],
+            serializer=ORJSONSerializer(),
             http_auth=(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD),
             use_ssl=True,
             verify_certs=True,
@@ -47,6 +122,7 @@ def create_opensearch_client():
             max_retries=5,
             retry_on_timeout=True,
             http_compress=True,
+            pool_maxsize=OPENSEARCH_POOL_MAXSIZE,
             headers={"Content-Type": "application/json"}
         )
     
@@ -59,19 +135,19 @@ T_MEMO_CARTE_MAPPING = {
             "number_of_shards": 1,
             "number_of_replicas": 0,
             "knn": True,
-            "knn.algo_param.ef_search": 100,
         },
         "analysis": {
             "analyzer": {
                 "japanese_analyzer": {
                     "type": "custom",
                     "tokenizer": "kuromoji_tokenizer",
+                    # icu_normalizer (NFKC) needs the analysis-icu plugin alongside analysis-kuromoji
                     "filter": [
+                        "icu_normalizer",
                         "kuromoji_baseform",
-                        "kuromoji_part_of_speech", 
-                        "kuromoji_stemmer",
-                        "lowercase",
-                        "stop"
+                        "kuromoji_part_of_speech",
+                        "cjk_width",
+                        "lowercase"
                     ]
                 }
             }
@@ -128,16 +204,19 @@ T_MEMO_CARTE_MAPPING = {
                 "type": "text",
                 "analyzer": "japanese_analyzer"
             },
+            "content_hash": {"type": "keyword", "index": False},
             "memo_vector": {
                 "type": "knn_vector",
                 "dimension": EMBEDDING_DIMENSION,
                 "method": {
                     "name": "hnsw",
                     "space_type": "cosinesimil",
-                    "engine": "nmslib",
+                    "engine": "lucene",
                     "parameters": {
                         "ef_construction": 128,
-                        "m": 24
+                        "m": 24,
+                        # Scalar quantization stores ~1 byte per dimension instead of 4
+                        "encoder": {"name": "sq"}
                     }
                 }
             },
@@ -163,19 +242,20 @@ JAPANESE_MEDICAL_DOCUMENTS_MAPPING = {
             "number_of_shards": 1,
             "number_of_replicas": 0,
             "knn": True,
-            "knn.algo_param.ef_search": 100,
+            "knn.algo_param.ef_search": 200,  # Offsets the recall lost to compression
         },
         "analysis": {
             "analyzer": {
                 "japanese_medical_analyzer": {
                     "type": "custom",
                     "tokenizer": "kuromoji_tokenizer",
+                    # icu_normalizer (NFKC) needs the analysis-icu plugin alongside analysis-kuromoji
                     "filter": [
+                        "icu_normalizer",
                         "kuromoji_baseform",
                         "kuromoji_part_of_speech",
-                        "kuromoji_stemmer",
-                        "lowercase",
-                        "stop"
+                        "cjk_width",
+                        "lowercase"
                     ]
                 }
             }
@@ -209,10 +289,14 @@ JAPANESE_MEDICAL_DOCUMENTS_MAPPING = {
             "document_vector": {
                 "type": "knn_vector",
                 "dimension": EMBEDDING_DIMENSION,
+                # Reference data is read-mostly: keep 32x-compressed vectors in memory
+                # and rescore candidates against the full-precision vectors on disk
+                "mode": "on_disk",
+                "compression_level": "32x",
                 "method": {
                     "name": "hnsw",
                     "space_type": "cosinesimil",
-                    "engine": "nmslib",
+                    "engine": "faiss",
                     "parameters": {
                         "ef_construction": 128,
                         "m": 24
@@ -235,10 +319,23 @@ JAPANESE_MEDICAL_DOCUMENTS_MAPPING = {
     }
 }
 
+def index_exists(client, index_name: str) -> bool:
+    """Check whether an index exists, memoized for INDEX_INFO_CACHE_TTL seconds"""
+    exists = _index_exists_cache.get(index_name)
+    if exists is None:
+        exists = client.indices.exists(index=index_name)
+        _index_exists_cache[index_name] = exists
+    return exists
+
+def invalidate_index_cache(index_name: str):
+    """Forget cached existence and info for an index after it changed"""
+    _index_exists_cache.pop(index_name, None)
+    _index_info_cache.pop(index_name, None)
+
 def create_index(client, index_name: str, mapping: dict):
     """Create an OpenSearch index with the specified mapping"""
     try:
-        if client.indices.exists(index=index_name):
+        if index_exists(client, index_name):
             print(f"Index {index_name} already exists")
             return True
         
@@ -246,12 +343,42 @@ def create_index(client, index_name: str, mapping: dict):
             index=index_name,
             body=mapping
         )
+        invalidate_index_cache(index_name)
         print(f"Created index {index_name}: {response}")
         return True
     except Exception as e:
         print(f"Error creating index {index_name}: {e}")
         return False
 
+def migrate_index(client, index_name: str, mapping: dict):
+    """Recreate an existing index with a new mapping, copying its documents across"""
+    temp_index_name = f"{index_name}_migration"
+    try:
+        if not client.indices.exists(index=index_name):
+            return create_index(client, index_name, mapping)
+        
+        # Vector method changes can't be applied in place, so copy out and back
+        client.indices.create(index=temp_index_name, body=mapping)
+        client.reindex(
+            body={"source": {"index": index_name}, "dest": {"index": temp_index_name}},
+            wait_for_completion=True,
+            request_timeout=3600
+        )
+        client.indices.delete(index=index_name)
+        client.indices.create(index=index_name, body=mapping)
+        client.reindex(
+            body={"source": {"index": temp_index_name}, "dest": {"index": index_name}},
+            wait_for_completion=True,
+            request_timeout=3600
+        )
+        client.indices.delete(index=temp_index_name)
+        invalidate_index_cache(index_name)
+        print(f"Migrated index {index_name}")
+        return True
+    except Exception as e:
+        print(f"Error migrating index {index_name}: {e}")
+        return False
+
 def create_all_indexes(client):
     """Create all required indexes"""
     indexes_created = []
@@ -266,40 +393,103 @@ def create_all_indexes(client):
     
     return indexes_created
 
+async def bulk_index_memo_cartes(client, docs: List[dict], chunk_size: int = 500):
+    """Index memo carte documents through the _bulk API, returning (indexed count, errors)"""
+    actions = (
+        {"_index": T_MEMO_CARTE_INDEX, "_id": doc["id_memo_carte"], "_source": doc}
+        for doc in docs
+    )
+    return await async_bulk(client, actions, chunk_size=chunk_size, raise_on_error=False)
+
+async def warm_knn_indexes(client):
+    """Run a 1-NN query against each vector index so its HNSW graph is loaded before real traffic"""
+    # A unit vector, since cosine similarity is undefined for the zero vector
+    probe_vector = [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1)
+    targets = [(T_MEMO_CARTE_INDEX, "memo_vector"), (JAPANESE_MEDICAL_DOCUMENTS_INDEX, "document_vector")]
+    
+    results = await asyncio.gather(
+        *(
+            client.search(
+                index=index_name,
+                body={"size": 1, "_source": False, "query": {"knn": {field: {"vector": probe_vector, "k": 1}}}}
+            )
+            for index_name, field in targets
+        ),
+        return_exceptions=True
+    )
+    
+    # Failures (e.g. an empty or missing index) only mean that index stays cold
+    warmed = []
+    for (index_name, _), result in zip(targets, results):
+        if isinstance(result, Exception):
+            print(f"Skipped warming index {index_name}: {result}")
+        else:
+            warmed.append(index_name)
+    return warmed
+
+async def get_indexed_content_hashes(client, memo_ids: List[int]) -> dict:
+    """Return the stored content_hash of each already indexed memo, keyed by document id"""
+    if not await client.indices.exists(index=T_MEMO_CARTE_INDEX):
+        return {}
+    response = await client.mget(
+        index=T_MEMO_CARTE_INDEX,
+        body={"ids": memo_ids},
+        _source_includes="content_hash"
+    )
+    return {
+        doc["_id"]: doc["_source"].get("content_hash")
+        for doc in response["docs"]
+        if doc.get("found")
+    }
+
 def delete_index(client, index_name: str):
     """Delete an OpenSearch index"""
     try:
-        if not client.indices.exists(index=index_name):
+        if not index_exists(client, index_name):
             return {"message": f"Index {index_name} does not exist"}
         
         response = client.indices.delete(index=index_name)
+        invalidate_index_cache(index_name)
         return {"message": f"Index {index_name} deleted successfully", "response": response}
     except Exception as e:
         return {"error": f"Failed to delete index {index_name}: {str(e)}"}
 
 def get_index_info(client, index_name: str):
-    """Get information about an index"""
+    """Get information about an index, memoized for INDEX_INFO_CACHE_TTL seconds"""
     try:
-        if not client.indices.exists(index=index_name):
+        info = _index_info_cache.get(index_name)
+        if info is not None:
+            return info
+        
+        if not index_exists(client, index_name):
             return {"error": f"Index {index_name} does not exist"}
         
         stats = client.indices.stats(index=index_name)
         mapping = client.indices.get_mapping(index=index_name)
         
-        return {
+        info = {
             "exists": True,
             "doc_count": stats["indices"][index_name]["total"]["docs"]["count"],
             "store_size": stats["indices"][index_name]["total"]["store"]["size_in_bytes"],
             "mapping": mapping[index_name]["mappings"]
         }
+        # Errors are not cached so a transient failure clears on the next call
+        _index_info_cache[index_name] = info
+        return info
     except Exception as e:
         return {"error": f"Failed to get info for index {index_name}: {str(e)}"}
     
     
 opensearch_client = create_opensearch_client()
+# Used by request handlers so searches don't block the event loop
+async_opensearch_client = create_async_opensearch_client()
 
 if __name__ == "__main__":
     # Test the OpenSearch client and create indexes
     client = create_opensearch_client()
+    if "--migrate" in sys.argv:
+        # Rebuild existing indexes with the current mappings
+        migrate_index(client, T_MEMO_CARTE_INDEX, T_MEMO_CARTE_MAPPING)
+        migrate_index(client, JAPANESE_MEDICAL_DOCUMENTS_INDEX, JAPANESE_MEDICAL_DOCUMENTS_MAPPING)
     created_indexes = create_all_indexes(client)
     print(f"Created indexes: {created_indexes}")
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+
+class AsyncLimiter:
+    """Token-bucket limiter that debits both a request and a token budget per call"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Top up both buckets in proportion to the time elapsed since the last refill"""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._available_requests = min(
+            self.requests_per_minute,
+            self._available_requests + elapsed * self.requests_per_minute / 60
+        )
+        self._available_tokens = min(
+            self.tokens_per_minute,
+            self._available_tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request and the estimated tokens fit in the budget, then debit them"""
+        # A call larger than the whole budget is let through once the bucket is full
+        tokens = min(tokens, self.tokens_per_minute)
+
+        # Waiters queue on the lock, so capacity is handed out first come, first served
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._available_requests >= 1 and self._available_tokens >= tokens:
+                    self._available_requests -= 1
+                    self._available_tokens -= tokens
+                    return
+
+                wait = max(
+                    (1 - self._available_requests) * 60 / self.requests_per_minute,
+                    (tokens - self._available_tokens) * 60 / self.tokens_per_minute
+                )
+                await asyncio.sleep(wait)
+
+    def refund(self, tokens: int = 0) -> None:
+        """Return a request and its tokens to the budget, e.g. after the API rejected the call"""
+        self._refill()
+        self._available_requests = min(self.requests_per_minute, self._available_requests + 1)
+        self._available_tokens = min(self.tokens_per_minute, self._available_tokens + tokens)
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Dict, List
 import logging
 from datetime import datetime
 
@@ -9,6 +11,7 @@ from models import (
     ConsultationStartRequest, 
     ConsultationStartResponse, 
     ConsultationResponse,
+    ConsultationSummaryResponse,
     PetCreate,
     PetResponse,
     QuestionTemplateResponse,
@@ -26,19 +29,19 @@ router = APIRouter(
 @router.post("/start", response_model=ConsultationStartResponse)
 async def start_consultation(
     request: ConsultationStartRequest, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Start a new consultation by analyzing the initial complaint
     """
     try:
         # Verify pet exists
-        pet = db.query(Pet).filter(Pet.id == request.pet_id).first()
+        pet = await db.get(Pet, request.pet_id)
         if not pet:
             raise HTTPException(status_code=404, detail="Pet not found")
         
         # Extract keywords and categorize complaint using OpenAI
-        logger.info(f"Processing complaint for pet {request.pet_id}: {request.initial_complaint[:100]}...")
+        logger.info("Processing complaint for pet %s: %s...", request.pet_id, request.initial_complaint[:100])
         
         analysis_result = await ConsultationService.extract_keywords_and_categorize(
             request.initial_complaint
@@ -64,12 +67,11 @@ async def start_consultation(
         )
         
         db.add(consultation)
-        db.commit()
-        db.refresh(consultation)
+        await db.commit()
         
-        logger.info(f"Created consultation {consultation.id} for pet {request.pet_id}")
-        logger.info(f"Category: {analysis_result.complaint_category}, Confidence: {analysis_result.confidence_score}")
-        logger.info(f"Keywords extracted: {analysis_result.extracted_keywords.dict()}")
+        logger.info("Created consultation %s for pet %s", consultation.id, request.pet_id)
+        logger.info("Category: %s, Confidence: %s", analysis_result.complaint_category, analysis_result.confidence_score)
+        logger.info("Keywords extracted: %s", analysis_result.extracted_keywords)
         
         return ConsultationStartResponse(
             consultation_id=consultation.id,
@@ -86,86 +88,156 @@ async def start_consultation(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error starting consultation: {e}")
-        db.rollback()
+        logger.error("Error starting consultation: %s", e)
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to start consultation: {str(e)}")
 
 @router.get("/{consultation_id}", response_model=ConsultationResponse)
-async def get_consultation(consultation_id: int, db: Session = Depends(get_db)):
+async def get_consultation(consultation_id: int, db: AsyncSession = Depends(get_db)):
     """Get consultation details by ID"""
-    consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
+    # The response embeds the pet, which can't be lazy-loaded in async code
+    consultation = await db.scalar(
+        select(Consultation).options(selectinload(Consultation.pet)).where(Consultation.id == consultation_id)
+    )
     if not consultation:
         raise HTTPException(status_code=404, detail="Consultation not found")
     
     return consultation
 
-@router.get("/pet/{pet_id}", response_model=List[ConsultationResponse])
-async def get_pet_consultations(pet_id: int, db: Session = Depends(get_db)):
+@router.get("/pet/{pet_id}", response_model=List[ConsultationSummaryResponse])
+async def get_pet_consultations(pet_id: int, db: AsyncSession = Depends(get_db)):
     """Get all consultations for a specific pet"""
-    pet = db.query(Pet).filter(Pet.id == pet_id).first()
-    if not pet:
+    # One outer join from the pet doubles as the existence check, and only the
+    # summary columns are read, not the JSON blobs or the pet itself
+    rows = await db.execute(
+        select(
+            Consultation.id,
+            Pet.id.label("pet_id"),
+            Consultation.initial_complaint,
+            Consultation.complaint_category,
+            Consultation.confidence_score,
+            Consultation.status,
+            Consultation.current_question_index,
+            Consultation.total_questions,
+            Consultation.created_at,
+            Consultation.updated_at,
+            Consultation.completed_at
+        )
+        .select_from(Pet)
+        .outerjoin(Pet.consultations)
+        .where(Pet.id == pet_id)
+        .order_by(Consultation.created_at.desc())
+    )
+    rows = rows.mappings().all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Pet not found")
     
-    consultations = db.query(Consultation).filter(Consultation.pet_id == pet_id).order_by(Consultation.created_at.desc()).all()
-    return consultations
+    # A pet without consultations comes back as a single row of NULL consultation columns
+    return [row for row in rows if row["id"] is not None]
 
 @router.post("/pet", response_model=PetResponse)
-async def create_pet(pet_data: PetCreate, db: Session = Depends(get_db)):
+async def create_pet(pet_data: PetCreate, db: AsyncSession = Depends(get_db)):
     """Create a new pet record"""
     try:
         pet = Pet(**pet_data.dict())
         db.add(pet)
-        db.commit()
-        db.refresh(pet)
+        await db.commit()
         
-        logger.info(f"Created pet {pet.id}: {pet.name}")
+        logger.info("Created pet %s: %s", pet.id, pet.name)
         return pet
         
     except Exception as e:
-        logger.error(f"Error creating pet: {e}")
-        db.rollback()
+        logger.error("Error creating pet: %s", e)
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create pet: {str(e)}")
 
+@router.post("/pet/bulk", response_model=List[PetResponse])
+async def create_pets_bulk(pets_data: List[PetCreate], db: AsyncSession = Depends(get_db)):
+    """Create many pet records in a single multi-row INSERT"""
+    if not pets_data:
+        return []
+    
+    try:
+        # INSERT ... RETURNING hands back the new rows, ids and server defaults included
+        pets = await db.scalars(
+            insert(Pet).returning(Pet),
+            [pet_data.model_dump() for pet_data in pets_data]
+        )
+        pets = pets.all()
+        await db.commit()
+        
+        logger.info("Created %s pets", len(pets))
+        return pets
+        
+    except Exception as e:
+        logger.error("Error creating pets: %s", e)
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to create pets: {str(e)}")
+
 @router.get("/pet/{pet_id}/details", response_model=PetResponse)
-async def get_pet(pet_id: int, db: Session = Depends(get_db)):
+async def get_pet(pet_id: int, db: AsyncSession = Depends(get_db)):
     """Get pet details by ID"""
-    pet = db.query(Pet).filter(Pet.id == pet_id).first()
+    pet = await db.get(Pet, pet_id)
     if not pet:
         raise HTTPException(status_code=404, detail="Pet not found")
     
     return pet
 
+async def load_question_templates(db: AsyncSession) -> Dict[str, List[QuestionTemplateResponse]]:
+    """Load every question template, grouped by category in question order"""
+    questions = await db.scalars(
+        select(QuestionTemplate).order_by(QuestionTemplate.category, QuestionTemplate.order_index)
+    )
+    
+    templates_by_category: Dict[str, List[QuestionTemplateResponse]] = {}
+    for question in questions:
+        templates_by_category.setdefault(question.category, []).append(
+            QuestionTemplateResponse.model_validate(question)
+        )
+    return templates_by_category
+
 @router.get("/questions/category/{category}", response_model=List[QuestionTemplateResponse])
-async def get_questions_by_category(category: str, db: Session = Depends(get_db)):
+async def get_questions_by_category(category: str, request: Request, db: AsyncSession = Depends(get_db)):
     """Get question templates for a specific category"""
-    questions = db.query(QuestionTemplate).filter(
-        QuestionTemplate.category == category
-    ).order_by(QuestionTemplate.order_index).all()
+    # Templates are static reference data, loaded once at startup
+    templates_by_category = getattr(request.app.state, "templates_by_category", None)
+    if templates_by_category is not None and category in templates_by_category:
+        return templates_by_category[category]
+    
+    # Not preloaded, e.g. templates seeded after startup: query and remember the category once it exists
+    questions = await db.scalars(
+        select(QuestionTemplate).where(
+            QuestionTemplate.category == category
+        ).order_by(QuestionTemplate.order_index)
+    )
+    templates = [QuestionTemplateResponse.model_validate(question) for question in questions]
+    if templates_by_category is not None and templates:
+        templates_by_category[category] = templates
     
-    return questions
+    return templates
 
 @router.put("/{consultation_id}/complete")
-async def complete_consultation(consultation_id: int, db: Session = Depends(get_db)):
+async def complete_consultation(consultation_id: int, db: AsyncSession = Depends(get_db)):
     """Mark consultation as completed"""
-    consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
+    consultation = await db.get(Consultation, consultation_id)
     if not consultation:
         raise HTTPException(status_code=404, detail="Consultation not found")
     
     consultation.status = ConsultationStatusEnum.COMPLETED.value
     consultation.completed_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Consultation marked as completed", "consultation_id": consultation_id}
 
 @router.delete("/{consultation_id}")
-async def cancel_consultation(consultation_id: int, db: Session = Depends(get_db)):
+async def cancel_consultation(consultation_id: int, db: AsyncSession = Depends(get_db)):
     """Cancel/delete a consultation"""
-    consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
+    consultation = await db.get(Consultation, consultation_id)
     if not consultation:
         raise HTTPException(status_code=404, detail="Consultation not found")
     
     consultation.status = ConsultationStatusEnum.CANCELLED.value
-    db.commit()
+    await db.commit()
     
     return {"message": "Consultation cancelled", "consultation_id": consultation_id}
\ No newline at end of file
@@ -1,21 +1,31 @@
 from fastapi import APIRouter,HTTPException
 from typing import List, Optional, Dict, Any
 import os
-import datetime
 import logging
 
-from utils import combine_memo_texts
-from openai_utils import get_embedding
+from utils import combine_memo_texts, memo_content_hash
+from openai_utils import (
+    get_embedding,
+    get_embeddings,
+    get_embedding_cache_stats,
+    OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION
+)
 from opensearch_utils import (
     create_opensearch_client, 
     create_all_indexes,
     opensearch_client,
+    async_opensearch_client,
     T_MEMO_CARTE_INDEX,
     JAPANESE_MEDICAL_DOCUMENTS_INDEX,
     get_index_info,
-    delete_index
+    delete_index,
+    bulk_index_memo_cartes,
+    get_indexed_content_hashes,
+    invalidate_index_cache
 )
 from models import IndexRequest,SearchRequest,SearchResponse
+from semantic_cache import SemanticCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,10 +34,58 @@ router = APIRouter(
   prefix="/api/opensearch"
 )
 
-# OpenAI configuration
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
+# Opt-in semantic search cache: near-duplicate vector queries reuse the results of an earlier search.
+# Off by default; entries expire after SEARCH_CACHE_TTL seconds, since other workers' index updates don't clear it
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 4096))
+SEARCH_CACHE_THRESHOLD = float(os.getenv("SEARCH_CACHE_THRESHOLD", 0))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 60))
+_search_cache = (
+    SemanticCache(EMBEDDING_DIMENSION, maxlen=SEARCH_CACHE_SIZE, threshold=SEARCH_CACHE_THRESHOLD, ttl=SEARCH_CACHE_TTL)
+    if SEARCH_CACHE_THRESHOLD > 0 else None
+)
+
+
+def _clear_search_cache() -> None:
+    """Drop cached search results after the memo index changes"""
+    if _search_cache is not None:
+        _search_cache.clear()
+
+# Constant parts of the search bodies, shared across requests since they are never mutated
+# Results carry only the fields the UI shows unless the request asks for more
+_SOURCE_INCLUDES = ["id_memo_carte", "combined_memo_text", "datetime_memo_carte", "flg_delete"]
+_SOURCE_EXCLUDES = ["memo_vector"]
+_DEFAULT_SOURCE = {"includes": _SOURCE_INCLUDES, "excludes": _SOURCE_EXCLUDES}
+_NOT_DELETED_FILTER = [{"term": {"flg_delete": 0}}]
+
+
+def _knn_clause(query_vector: List[float], request: SearchRequest, **options) -> Dict[str, Any]:
+    """Build the kNN clause for a memo vector search"""
+    return {
+        "knn": {
+            "memo_vector": {
+                "vector": query_vector,
+                "k": request.size,
+                # HNSW can't return more than ef_search candidates, so never go below k
+                "method_parameters": {"ef_search": max(request.ef_search, request.size)},
+                **options
+            }
+        }
+    }
+
+
+def _keyword_clause(request: SearchRequest, **options) -> Dict[str, Any]:
+    """Build the keyword clause for a memo text search"""
+    return {
+        "multi_match": {
+            "query": request.query,
+            # Every memo field is folded into combined_memo_text at ingest,
+            # so a single analyzed field covers them all
+            "fields": ["combined_memo_text"],
+            "type": "best_fields",
+            "analyzer": "japanese_analyzer",
+            **options
+        }
+    }
 
 
 @router.get("/embedding-info")
@@ -37,7 +95,8 @@ async def get_embedding_info():
         "embedding_model": OPENAI_EMBEDDING_MODEL,
         "embedding_dimension": EMBEDDING_DIMENSION,
         "available_indexes": [T_MEMO_CARTE_INDEX, JAPANESE_MEDICAL_DOCUMENTS_INDEX],
-        "opensearch_endpoint": os.getenv("OPENSEARCH_ENDPOINT")
+        "opensearch_endpoint": os.getenv("OPENSEARCH_ENDPOINT"),
+        "embedding_cache": get_embedding_cache_stats()
     }
 
 
@@ -54,7 +113,7 @@ async def list_indexes():
             "indexes_info": indexes_info
         }
     except Exception as e:
-        logger.error(f"Error listing indexes: {e}")
+        logger.error("Error listing indexes: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to list indexes: {str(e)}")
       
       
@@ -76,7 +135,7 @@ async def get_opensearch_index_info(index_name: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting index info: {e}")
+        logger.error("Error getting index info: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get index info: {str(e)}")
 
 @router.delete("/index/{index_name}")
@@ -92,11 +151,13 @@ async def delete_opensearch_index(index_name: str):
             )
         
         result = delete_index(opensearch_client, index_name)
+        if index_name == T_MEMO_CARTE_INDEX:
+            _clear_search_cache()
         return result
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting index: {e}")
+        logger.error("Error deleting index: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete index: {str(e)}")
 
 
@@ -104,55 +165,73 @@ async def delete_opensearch_index(index_name: str):
 async def index_memo_carte_data(request: IndexRequest):
     """Index memo carte data to OpenSearch with OpenAI vector embeddings"""
     try:
-        indexed_count = 0
         errors = []
         
-        for memo in request.data:
-            try:
-                # Combine memo texts for vectorization
-                combined_text = combine_memo_texts(memo)
-                
-                # Generate vector embedding if there's text content
-                memo_vector = None
-                if combined_text.strip():
-                    memo_vector = await get_embedding(combined_text)
-                    logger.info(f"Generated embedding for memo {memo.id_memo_carte} with {len(combined_text)} characters")
-                
-                # Prepare document for indexing
-                doc = {
-                    **memo.dict(),
-                    "combined_memo_text": combined_text,
-                    "memo_vector": memo_vector
-                }
-                
-                # Convert datetime objects to ISO format strings
-                for field in ["datetime_memo_carte", "datetime_insert", "datetime_update"]:
-                    if doc.get(field):
-                        doc[field] = doc[field].isoformat() if isinstance(doc[field], datetime) else doc[field]
-                
-                # Index document to t_memo_carte index
-                response = opensearch_client.index(
-                    index=T_MEMO_CARTE_INDEX,
-                    id=memo.id_memo_carte,
-                    body=doc
-                )
-                
-                if response.get("result") in ["created", "updated"]:
-                    indexed_count += 1
-                    logger.info(f"Successfully indexed memo {memo.id_memo_carte}")
-                else:
-                    errors.append(f"Failed to index memo {memo.id_memo_carte}: {response}")
-                    
-            except Exception as e:
-                errors.append(f"Error processing memo {memo.id_memo_carte}: {str(e)}")
-                logger.error(f"Error indexing memo {memo.id_memo_carte}: {e}")
+        # Skip memos that are unchanged since they were last indexed
+        content_hashes = [memo_content_hash(memo) for memo in request.data]
+        indexed_hashes = await get_indexed_content_hashes(
+            async_opensearch_client,
+            [memo.id_memo_carte for memo in request.data]
+        )
+        changed = [
+            (memo, content_hash)
+            for memo, content_hash in zip(request.data, content_hashes)
+            if indexed_hashes.get(str(memo.id_memo_carte)) != content_hash
+        ]
+        skipped_count = len(request.data) - len(changed)
+        if not changed:
+            return {
+                "message": "All memos are already up to date",
+                "indexed_count": 0,
+                "skipped_count": skipped_count,
+                "total_requested": len(request.data),
+                "embedding_model": OPENAI_EMBEDDING_MODEL,
+                "embedding_dimension": EMBEDDING_DIMENSION,
+                "errors": []
+            }
+        
+        # Combine memo texts for vectorization
+        combined_texts = [combine_memo_texts(memo) for memo, _ in changed]
+        
+        # Generate vector embeddings in batched requests for memos with text content
+        to_embed = [i for i, text in enumerate(combined_texts) if text.strip()]
+        memo_vectors = [None] * len(changed)
+        if to_embed:
+            embeddings = await get_embeddings([combined_texts[i] for i in to_embed])
+            for i, embedding in zip(to_embed, embeddings):
+                memo_vectors[i] = embedding
+            logger.info("Generated %s embeddings for %s changed memos", len(to_embed), len(changed))
+        
+        docs = []
+        for (memo, content_hash), combined_text, memo_vector in zip(changed, combined_texts, memo_vectors):
+            # Prepare document for indexing
+            doc = {
+                **memo.model_dump(),
+                "combined_memo_text": combined_text,
+                "memo_vector": memo_vector,
+                "content_hash": content_hash
+            }
+            
+            docs.append(doc)
+        
+        # Index all documents to t_memo_carte index in _bulk requests
+        indexed_count, bulk_errors = await bulk_index_memo_cartes(async_opensearch_client, docs)
+        for item in bulk_errors:
+            failure = item.get("index", {})
+            errors.append(f"Failed to index memo {failure.get('_id')}: {failure.get('error')}")
+        logger.info("Bulk indexed %s memos, %s failed", indexed_count, len(bulk_errors))
         
         # Refresh index to make documents searchable
-        opensearch_client.indices.refresh(index=T_MEMO_CARTE_INDEX)
+        await async_opensearch_client.indices.refresh(index=T_MEMO_CARTE_INDEX)
+        invalidate_index_cache(T_MEMO_CARTE_INDEX)
+
+        # Cached search results may no longer reflect the index
+        _clear_search_cache()
         
         return {
             "message": f"Indexing completed using {OPENAI_EMBEDDING_MODEL}",
             "indexed_count": indexed_count,
+            "skipped_count": skipped_count,
             "total_requested": len(request.data),
             "embedding_model": OPENAI_EMBEDDING_MODEL,
             "embedding_dimension": EMBEDDING_DIMENSION,
@@ -160,7 +239,7 @@ async def index_memo_carte_data(request: IndexRequest):
         }
         
     except Exception as e:
-        logger.error(f"Error during indexing: {e}")
+        logger.error("Error during indexing: %s", e)
         raise HTTPException(status_code=500, detail=f"Indexing failed: {str(e)}")
 
 
@@ -168,121 +247,52 @@ async def index_memo_carte_data(request: IndexRequest):
 async def search_memo_carte(request: SearchRequest):
     """Perform vector, keyword, or hybrid search on memo carte data using OpenAI embeddings"""
     try:
-        if request.search_type == "vector":
-            # Pure vector search using OpenAI embeddings
+        query_vector = None
+        # Only pure vector results depend on the embedding alone; hybrid also matches the literal query text
+        use_cache = _search_cache is not None and request.search_type == "vector"
+        if request.search_type != "keyword":
+            # Vector and hybrid search use OpenAI embeddings
             query_vector = await get_embedding(request.query)
-            logger.info(f"Generated query embedding for: {request.query}")
-            
-            search_body = {
-                "size": request.size,
-                "query": {
-                    "knn": {
-                        "memo_vector": {
-                            "vector": query_vector,
-                            "k": request.size
-                        }
-                    }
-                },
-                "_source": {
-                    "excludes": ["memo_vector"]
-                }
-            }
+            logger.info("Generated query embedding for %s search: %s", request.search_type, request.query)
             
+        if use_cache:
+            # Reuse the results of a near-identical earlier query
+            cache_namespace = (request.size, request.ef_search, tuple(request.fields or ()))
+            cached_response = _search_cache.get(query_vector, cache_namespace)
+            if cached_response is not None:
+                logger.info("Semantic cache hit for '%s' using %s", request.query, request.search_type)
+                return cached_response
+        
+        if request.search_type == "vector":
+            # Pure vector search
+            search_query = {"bool": {"must": [_knn_clause(query_vector, request)], "filter": _NOT_DELETED_FILTER}}
         elif request.search_type == "keyword":
             # Pure keyword search with Japanese analyzer
-            search_body = {
-                "size": request.size,
-                "query": {
-                    "multi_match": {
-                        "query": request.query,
-                        "fields": [
-                            "combined_memo_text^2",
-                            "memo_other^1.5",
-                            "memo_transcription_ai",
-                            "memo_customer_ai",
-                            "memo_service_ai",
-                            "memo_illness_ai",
-                            "memo_plan_ai",
-                            "memo_prescription_ai",
-                            "memo_ass",
-                            "memo_obj",
-                            "memo_sbj"
-                        ],
-                        "type": "best_fields",
-                        "analyzer": "japanese_analyzer"
-                    }
-                },
-                "_source": {
-                    "excludes": ["memo_vector"]
-                }
-            }
-            
+            search_query = {"bool": {"must": [_keyword_clause(request)], "filter": _NOT_DELETED_FILTER}}
         else:  # hybrid search (default)
-            # Hybrid search combining OpenAI vector and keyword search
-            query_vector = await get_embedding(request.query)
-            logger.info(f"Generated query embedding for hybrid search: {request.query}")
-            
-            search_body = {
-                "size": request.size,
-                "query": {
-                    "bool": {
-                        "should": [
-                            {
-                                "knn": {
-                                    "memo_vector": {
-                                        "vector": query_vector,
-                                        "k": request.size,
-                                        "boost": 1.2
-                                    }
-                                }
-                            },
-                            {
-                                "multi_match": {
-                                    "query": request.query,
-                                    "fields": [
-                                        "combined_memo_text^2",
-                                        "memo_other^1.5",
-                                        "memo_transcription_ai",
-                                        "memo_customer_ai",
-                                        "memo_service_ai",
-                                        "memo_illness_ai",
-                                        "memo_plan_ai",
-                                        "memo_prescription_ai",
-                                        "memo_ass",
-                                        "memo_obj",
-                                        "memo_sbj"
-                                    ],
-                                    "type": "best_fields",
-                                    "analyzer": "japanese_analyzer",
-                                    "boost": 0.8
-                                }
-                            }
-                        ],
-                        "minimum_should_match": 1
-                    }
-                },
-                "_source": {
-                    "excludes": ["memo_vector"]
+            # Hybrid search combining vector and keyword search
+            search_query = {
+                "bool": {
+                    "should": [
+                        _knn_clause(query_vector, request, boost=1.2),
+                        _keyword_clause(request, boost=0.8)
+                    ],
+                    "minimum_should_match": 1,
+                    "filter": _NOT_DELETED_FILTER
                 }
             }
         
-        # Add filter for non-deleted records
-        if "query" in search_body and "bool" not in search_body["query"]:
-            search_body["query"] = {
-                "bool": {
-                    "must": [search_body["query"]],
-                    "filter": [
-                        {"term": {"flg_delete": 0}}
-                    ]
-                }
+        search_body = {
+            "size": request.size,
+            "query": search_query,
+            "_source": _DEFAULT_SOURCE if not request.fields else {
+                "includes": _SOURCE_INCLUDES + request.fields,
+                "excludes": _SOURCE_EXCLUDES
             }
-        elif "query" in search_body and "bool" in search_body["query"]:
-            if "filter" not in search_body["query"]["bool"]:
-                search_body["query"]["bool"]["filter"] = []
-            search_body["query"]["bool"]["filter"].append({"term": {"flg_delete": 0}})
+        }
         
         # Execute search on t_memo_carte index
-        response = opensearch_client.search(
+        response = await async_opensearch_client.search(
             index=T_MEMO_CARTE_INDEX,
             body=search_body
         )
@@ -297,16 +307,20 @@ async def search_memo_carte(request: SearchRequest):
             }
             results.append(result)
         
-        logger.info(f"Search completed: {len(results)} results for '{request.query}' using {request.search_type}")
+        logger.info("Search completed: %s results for '%s' using %s", len(results), request.query, request.search_type)
         
-        return SearchResponse(
+        search_response = SearchResponse(
             results=results,
             total=response["hits"]["total"]["value"],
             took=response["took"],
             search_type=request.search_type
         )
+        if use_cache:
+            _search_cache.put(query_vector, search_response, cache_namespace)
+        
+        return search_response
         
     except Exception as e:
-        logger.error(f"Search error: {e}")
+        logger.error("Search error: %s", e)
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
@@ -0,0 +1,70 @@
+import time
+import numpy as np
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+
+class SemanticCache:
+    """Fixed-size FIFO cache of values keyed by embedding, matched on cosine similarity, with optional expiry"""
+
+    def __init__(self, dimension: int, maxlen: int = 4096, threshold: float = 0.97, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.maxlen = maxlen
+        self.ttl = ttl
+        # Rows are L2-normalized so a dot product is the cosine similarity
+        self._vectors = np.zeros((maxlen, dimension), dtype=np.float32)
+        self._namespaces = np.full(maxlen, -1, dtype=np.int64)
+        self._expires = np.full(maxlen, np.inf)
+        self._namespace_ids: Dict[Hashable, int] = {}
+        self._next_namespace_id = 0
+        self._values: List[Any] = [None] * maxlen
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        """Return the vector as a unit-length float32 array"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _namespace_id(self, namespace: Hashable) -> int:
+        """Return the id for a namespace being stored, forgetting namespaces no entry uses anymore"""
+        if namespace not in self._namespace_ids:
+            # Entries are evicted FIFO, so at most maxlen namespaces can still be in use
+            if len(self._namespace_ids) >= self.maxlen:
+                live = set(self._namespaces[:self._size].tolist())
+                self._namespace_ids = {key: id_ for key, id_ in self._namespace_ids.items() if id_ in live}
+            self._namespace_ids[namespace] = self._next_namespace_id
+            self._next_namespace_id += 1
+        return self._namespace_ids[namespace]
+
+    def get(self, vector: Sequence[float], namespace: Hashable = None) -> Optional[Any]:
+        """Return the value stored under the most similar vector in the namespace, if similar enough"""
+        namespace_id = self._namespace_ids.get(namespace)
+        if not self._size or namespace_id is None:
+            return None
+
+        similarities = self._vectors[:self._size] @ self._normalize(vector)
+        stale = self._namespaces[:self._size] != namespace_id
+        stale |= self._expires[:self._size] <= time.monotonic()
+        similarities[stale] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return self._values[best]
+        return None
+
+    def put(self, vector: Sequence[float], value: Any, namespace: Hashable = None) -> None:
+        """Store a value under a vector, evicting the oldest entry when full"""
+        self._vectors[self._next] = self._normalize(vector)
+        self._namespaces[self._next] = self._namespace_id(namespace)
+        self._expires[self._next] = time.monotonic() + self.ttl if self.ttl else np.inf
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.maxlen
+        self._size = min(self._size + 1, self.maxlen)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        self._values = [None] * self.maxlen
+        self._namespace_ids = {}
+        self._size = 0
+        self._next = 0
@@ -1,11 +1,16 @@
+import hashlib
 from models import MemoCarteModel
+from openai_utils import OPENAI_EMBEDDING_MODEL, EMBEDDING_DIMENSION
+
+# Bump when combine_memo_texts or the indexed document layout changes, so every memo is re-indexed
+INDEX_PIPELINE_VERSION = 1
+# A new embedding model or dimension also invalidates the stored vectors
+_CONTENT_HASH_PREFIX = f"{INDEX_PIPELINE_VERSION}\0{OPENAI_EMBEDDING_MODEL}\0{EMBEDDING_DIMENSION}\0".encode()
 
 
 def combine_memo_texts(memo: MemoCarteModel) -> str:
     """Combine all memo text fields for better search"""
-    text_parts = []
-    
-    fields_to_combine = [
+    fields_to_combine = (
         memo.memo_other,
         memo.memo_transcription_ai,
         memo.memo_customer_ai,
@@ -16,10 +21,12 @@ def combine_memo_texts(memo: MemoCarteModel) -> str:
         memo.memo_ass,
         memo.memo_obj,
         memo.memo_sbj
-    ]
-    
-    for field in fields_to_combine:
-        if field and field.strip():
-            text_parts.append(field.strip())
+    )
     
-    return " ".join(text_parts)
\ No newline at end of file
+    # Strip each field once and drop the empty ones
+    return " ".join(text for text in (field.strip() for field in fields_to_combine if field) if text)
+
+
+def memo_content_hash(memo: MemoCarteModel) -> str:
+    """Hash every memo field and the embedding setup, so an unchanged memo can be recognized without comparing documents"""
+    return hashlib.sha256(_CONTENT_HASH_PREFIX + memo.model_dump_json().encode()).hexdigest()